@@ -10,6 +10,9 @@ from nameparser import HumanName
 
 DEFAULT_OUTPUT = "clean_names.csv"
 re_std_suffix = re.compile("(JR|SR|PHD)[^\.]", flags=re.I)
+re_split_names = re.compile('[&/]')
+re_parenthesis = re.compile(r'\s*\(.*\)\s*')
+re_quote = re.compile(r'\s*[\'"].*[\"\']\s*')
 
 def parse_command_line(argv):
     """Parse command line options
@@ -33,10 +36,12 @@ def parse_command_line(argv):
     return parser.parse_args(argv)
 
 
-def clean_names(infile, outfile=DEFAULT_OUTPUT, col="Name", all=False):
+def clean_names(infile, outfile=DEFAULT_OUTPUT, col="Name", all=False,
+                return_list=True):
     """ Read names and pre-process
         Returns unique names in format "FirstName LastName AnyRomanNumeral"\
         or "FirstName LastName"
+        (the list is not built when return_list is False)
     """
     print("Processing and exporting, please wait...")
 
@@ -48,32 +53,51 @@ def clean_names(infile, outfile=DEFAULT_OUTPUT, col="Name", all=False):
             outfile = None
 
     with open(infile) as f:
-        reader = csv.DictReader(f)
+        reader = csv.reader(f)
+        fieldnames = next(reader)
+        name_idx = fieldnames.index(col)
+        if return_list:
+            seat_idx = fieldnames.index('seat')
+        new_cols = ['uniqid', 'FirstName', 'MiddleInitial/Name', 'LastName',
+                    'RomanNumeral', 'Title', 'Suffix']
+        # Input columns with the same names get the new values too
+        old_cols = [(i, new_cols.index(c)) for i, c in enumerate(fieldnames)
+                    if c in new_cols]
         if outfile:
-            writer = csv.DictWriter(of, fieldnames=reader.fieldnames +
-                                    ['uniqid', 'FirstName',
-                                     'MiddleInitial/Name', 'LastName',
-                                     'RomanNumeral', 'Title', 'Suffix'])
-            writer.writeheader()
+            writer = csv.writer(of)
+            writer.writerow(fieldnames + new_cols)
         rowid = 0
-        allnames = []
+        allnames = set()
         allnameswithid = []
+        # One parser for all names, re-parsed by setting its full_name
+        hn = HumanName()
+        width = len(fieldnames)
         for r in reader:
-            rname = r[col]
-            for name in re.split('[&/]', rname):
-                name, n = re.subn(r'\s*\(.*\)\s*', ' ', name)
+            if not r:
+                # skip blank line
+                continue
+            if len(r) < width:
+                # Missing fields are empty, as with csv.DictReader
+                r += [''] * (width - len(r))
+            elif len(r) > width:
+                raise ValueError("Row has more fields than the header: {0!r}"
+                                 .format(r))
+            rname = r[name_idx]
+            for name in re_split_names.split(rname):
+                name, n = re_parenthesis.subn(' ', name)
                 if n > 0:
                     #print "Remove Parenthesis...", name
                     pass
-                name, n = re.subn(r'\s*[\'"].*[\"\']\s*', ' ', name)
+                name, n = re_quote.subn(' ', name)
                 if n > 0:
                     #print "Remove Quote...", name
                     pass
-                name = HumanName(name)
+                hn.full_name = name
+                name = hn
                 if name.last == '':
                     a = name.suffix.split(',')
                     if len(a) >= 2:
-                        name = HumanName(name.first + ', ' + a[1] + ' ' + a[0])
+                        name.full_name = name.first + ', ' + a[1] + ' ' + a[0]
                 first = name.first.lower()
                 mid = name.middle.lower()
                 roman = ""
@@ -127,24 +151,22 @@ def clean_names(infile, outfile=DEFAULT_OUTPUT, col="Name", all=False):
 
                 if all or (first, mid, last) not in allnames:
                     rowid += 1
-                    r['uniqid'] = rowid
-                    allnameswithid.append((r['uniqid'], first, mid, last,
-                                           r['seat'].strip()))
-                    allnames.append((first, mid, last))
-                    #print "Add...", r['uniqid'], first, "-", mid, "-", last, "-", r['seat'].strip()
-                    s = {'FirstName': first.upper(),
-                         'MiddleInitial/Name': mid.upper(),
-                         'LastName': name.last,
-                         'RomanNumeral': roman.upper(),
-                         'Title': title.upper(),
-                         'Suffix': suffix.upper()}
-                    t = dict(r, **s)
+                    if return_list:
+                        allnameswithid.append((rowid, first, mid, last,
+                                               r[seat_idx].strip()))
+                    allnames.add((first, mid, last))
+                    #print "Add...", rowid, first, "-", mid, "-", last
                     if outfile:
-                        writer.writerow(t)
+                        values = [rowid, first.upper(), mid.upper(), name.last,
+                                  roman.upper(), title.upper(), suffix.upper()]
+                        for i, j in old_cols:
+                            r[i] = values[j]
+                        writer.writerow(r + values)
         if outfile:
             of.close()
         print("Done.")
-        return allnameswithid
+        if return_list:
+            return allnameswithid
     return None
 
 
@@ -153,7 +175,8 @@ def main(argv=sys.argv[1:]):
     args = parse_command_line(argv)
     print(args)
 
-    clean_names(args.input, args.outfile, args.column, args.all)
+    clean_names(args.input, args.outfile, args.column, args.all,
+                return_list=False)
 
     return 0
 
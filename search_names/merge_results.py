@@ -1,13 +1,15 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import io
 import sys
 import argparse
 import logging
-from csv import DictWriter, DictReader
+import csv
 
 LOG_FILE = 'merge_results.log'
 DEFAULT_OUTPUT_FILE = 'merged_search_results.csv'
+BUFFER_SIZE = 1 << 20
 
 
 def setup_logger():
@@ -25,28 +27,64 @@ def setup_logger():
     logging.getLogger('').addHandler(console)
 
 
+def copy_rest(src, dst):
+    """Copy the rest of a binary file, returns its last byte (b'' if none)
+    """
+    last = b''
+    while True:
+        block = src.read(BUFFER_SIZE)
+        if not block:
+            break
+        dst.write(block)
+        last = block[-1:]
+    return last
+
+
 def merge_results(infile = None, outfile = DEFAULT_OUTPUT_FILE):
    
-    out = open(outfile, 'w')
-    count = 0
+    out = open(outfile, 'wb', buffering=BUFFER_SIZE)
     try:
+        fieldnames = None
         for n, i in enumerate(infile):
             logging.info("Merging...: '{0}'".format(i))
-            with open(i, 'r') as f:
-                reader = DictReader(f)
-                if n == 0:
-                    writer = DictWriter(out, fieldnames=reader.fieldnames)
-                    writer.writeheader()
-                for r in reader:
-                    writer.writerow(r)
-                    count += 1
+            with open(i, 'rb', buffering=BUFFER_SIZE) as f:
+                line = f.readline()
+                if not line.strip():
+                    continue
+                header = next(csv.reader([line.decode('utf-8')]))
+                if fieldnames is None:
+                    fieldnames = header
+                    out.write(line.rstrip(b'\r\n') + b'\r\n')
+                if header == fieldnames:
+                    # Same columns, copy the rows as they are (not parsed,
+                    # so they are not counted)
+                    if copy_rest(f, out) not in (b'', b'\n'):
+                        out.write(b'\r\n')
+                else:
+                    # Re-order columns by name when a chunk has a
+                    # different header, written out in batches
+                    pos = dict((c, k) for k, c in enumerate(header))
+                    idx = [pos.get(c) for c in fieldnames]
+                    buf = io.StringIO()
+                    writer = csv.writer(buf)
+                    reader = csv.reader(io.TextIOWrapper(f, encoding='utf-8',
+                                                         newline=''))
+                    for r in reader:
+                        if not r:
+                            continue
+                        writer.writerow([r[k] if k is not None and
+                                         k < len(r) else '' for k in idx])
+                        if buf.tell() >= BUFFER_SIZE:
+                            out.write(buf.getvalue().encode('utf-8'))
+                            buf.seek(0)
+                            buf.truncate()
+                    out.write(buf.getvalue().encode('utf-8'))
     except Exception as e:
         logging.error(e)
     finally:
         out.close()
 
-    logging.info("Done! (merge: {0} rows, from {1} files"
-                 .format(count, len(infile)))
+    logging.info("Done! (merge: {0} files)".format(len(infile)))
 
 
 
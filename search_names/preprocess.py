@@ -5,16 +5,32 @@ import sys
 import argparse
 import csv
 import itertools
+import logging
 
-from copy import copy
 import traceback
+from bisect import bisect_right
 
-from Levenshtein import distance
+from multiprocessing import Pool
+
+from rapidfuzz.distance.Levenshtein import distance
+from rapidfuzz.process import extract
 
 DEFAULT_OUTPUT = "deduped_augmented_clean_names.csv"
 DEFAULT_DROP_PATTERNS = "drop_patterns.txt"
 DEFAULT_PATTERNS = ["FirstName LastName", "NickName LastName", "Prefix LastName"]
 DEFAULT_EDITLENGTH = []
+DEFAULT_PROCESSES = 1
+
+# Names and edit lengths of the duplicate search, set by init_worker()
+_names = None
+_editlength = None
+_lengths = None  # name length ==> (sorted indexes, names) of the names
+
+# Planned patterns and drop patterns of the name expansion, set by
+# init_expand()
+_pattern_parts = None
+_drop_patterns = None
+_debug = False
 
 def parse_command_line(argv):
     """Parse command line options
@@ -39,104 +55,239 @@ def parse_command_line(argv):
                         default=DEFAULT_EDITLENGTH,
                         help="List of Edit Lengths\
                         (default: {0!s})".format(DEFAULT_EDITLENGTH))
+    parser.add_argument("--processes", type=int, dest="processes",
+                        default=DEFAULT_PROCESSES,
+                        help="Number of processes to build search names\
+                        and find duplicates (default: {0:d})"
+                        .format(DEFAULT_PROCESSES))
     return parser.parse_args(argv)
 
 
 def load_drop_patterns(filename):
+    """Returns the set of (lowercase) names to drop from the file
+    """
     drop_patterns = []
     try:
         with open(filename) as f:
             for l in f:
                 l = l.strip().lower()
-                if len(l): # null string
+                if not len(l): # null string
                     continue
                 drop_patterns.append(l)
     except Exception as e:
         print('Drop pattern file {0!s} not found'.format(filename))
-    return drop_patterns
+    return frozenset(drop_patterns)
+
+
+def get_max_distance(name, editlength):
+    """Returns max. edit distance allowed for the name
+    """
+    max_dist = 0
+    for k, l in enumerate(editlength):
+        if len(name) > l:
+            max_dist = k + 1
+    return max_dist
+
+
+def init_worker(names, editlength):
+    global _names, _editlength, _lengths
+    _names = names
+    _editlength = editlength
+    _lengths = {}
+    for i, name in enumerate(names):
+        if len(name) not in _lengths:
+            _lengths[len(name)] = ([], [])
+        idx, l_names = _lengths[len(name)]
+        idx.append(i)
+        l_names.append(name)
 
 
-def preprocess(infile = None, patterns = DEFAULT_PATTERNS, outfile = DEFAULT_OUTPUT, editlength = DEFAULT_EDITLENGTH, drop_patterns = None):
+def find_close_names(i):
+    """Returns indexes of the names after the i-th name which are within
+       its max. edit distance
+    """
+    name1 = _names[i]
+    max_dist = get_max_distance(name1, _editlength)
+    close = []
+    # Names differ in length by more than max_dist can't be within it
+    for l in range(len(name1) - max_dist, len(name1) + max_dist + 1):
+        if l not in _lengths:
+            continue
+        idx, l_names = _lengths[l]
+        start = bisect_right(idx, i)
+        if start == len(idx):
+            continue
+        # Distances to all the names of length l in one call
+        # (processor=None, names are compared as they are)
+        for _, _, k in extract(name1, l_names[start:], scorer=distance,
+                               processor=None, score_cutoff=max_dist,
+                               limit=None):
+            close.append(idx[start + k])
+    close.sort()
+    return close
+
+
+def init_expand(pattern_parts, drop_patterns):
+    global _pattern_parts, _drop_patterns, _debug
+    _pattern_parts = pattern_parts
+    _drop_patterns = drop_patterns
+    # Per name tracing is only logged at DEBUG level
+    _debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+
+
+def expand_row(args):
+    """Returns the search names generated from the i-th input row
+    """
+    i, r = args
+    debug = _debug
+    if debug:
+        logging.debug("#%d:", i)
+    out = []
+    # Values of each name part, looked up once per row
+    values = {}
+    for p, parr in _pattern_parts:
+        if debug:
+            logging.debug("Pattern: '%s'", p)
+        s = []
+        for a, k, is_list in parr:
+            if a not in values:
+                if is_list:
+                    values[a] = tuple(r[k].split(';'))
+                else:
+                    values[a] = (r[k].lower(),)
+            s.append(values[a])
+        if len(s) == 2:
+            # Common two part pattern, both parts must be non-empty
+            names = [a + ' ' + b for a in s[0] if a for b in s[1] if b]
+        else:
+            names = []
+            for c in itertools.product(*s):
+                c = [d for d in c if len(d)]
+                if len(c) > 1:
+                    names.append(' '.join(c))
+        for name in names:
+            if name.lower() not in _drop_patterns:
+                if debug:
+                    logging.debug(" Name: '%s'", name)
+                out.append(name)
+    return out
+
+
+def preprocess(infile = None, patterns = DEFAULT_PATTERNS, outfile = DEFAULT_OUTPUT, editlength = DEFAULT_EDITLENGTH, drop_patterns = None, processes = DEFAULT_PROCESSES):
     """Preprocessing names file
     """
     print("Preprocessing to '{0!s}', please wait...".format(outfile))
     o = None
+    pool = None
 
     try:
         f = None
         f = open(infile, 'r')
-        reader = csv.DictReader(f)
-        out = []
+        reader = csv.reader(f)
+        fieldnames = next(reader)
+        col = {k: i for i, k in enumerate(fieldnames)}
+        uid_idx = col['uniqid']
+        # Generated search names and their (shared) input rows
+        names = []
+        rows = []
+        # Split the patterns into name parts once, each part is planned as
+        # (name part, column index, whether a ';' separated list)
+        part_plan = {}
+        for a in set(a for p in patterns for a in p.split()):
+            if a == 'Prefix':
+                part_plan[a] = (a, col['prefixes'], True)
+            elif a == 'NickName':
+                part_plan[a] = (a, col['nick_names'], True)
+            else:
+                part_plan[a] = (a, col[a], False)
+        pattern_parts = [(p, [part_plan[a] for a in p.split()])
+                         for p in patterns]
+        # Names are checked lowercased, as prefixes and nick names keep their
+        # case, normalize the drop patterns the way load_drop_patterns() does
+        drop_patterns = frozenset(d.strip().lower() for d in drop_patterns or ())
         print("Build search names...")
+        width = len(fieldnames)
+        rows_in = []
         for i, r in enumerate(reader):
-            print("#{0}:".format(i))
-            for p in patterns:
-                print("Pattern: '{0}'".format(p))
-                parr = p.split()
-                s = []
-                for a in parr:
-                    a = a.strip()
-                    if a == 'Prefix':
-                        prefixes = r['prefixes'].split(';')
-                        s.append(prefixes)
-                    elif a == 'NickName':
-                        nick_names = r['nick_names'].split(';')
-                        s.append(nick_names)
-                    else:
-                        s.append([r[a].lower()])
-                combines = list(itertools.product(*s))
-                for c in combines:
-                    c = [d for d in c if len(d)]
-                    if len(c) > 1:
-                        name = ' '.join(c)
-                        if name not in drop_patterns:
-                            print(" Name: '{0}'".format(name))
-                            new_r = copy(r)
-                            new_r['search_name'] = name
-                            out.append(new_r)
+            if not r:
+                continue
+            if len(r) < width:
+                # Missing fields are empty, as with csv.DictReader
+                r += [''] * (width - len(r))
+            elif len(r) > width:
+                raise ValueError("Row #{0:d} has more fields than the header"
+                                 .format(i))
+            rows_in.append((i, r))
+        if processes > 1:
+            pool = Pool(processes=processes, initializer=init_expand,
+                        initargs=(pattern_parts, drop_patterns))
+            chunksize = max(1, len(rows_in) // (processes * 4))
+            expanded = pool.imap(expand_row, rows_in, chunksize)
+        else:
+            init_expand(pattern_parts, drop_patterns)
+            expanded = map(expand_row, rows_in)
+        for (i, r), row_names in zip(rows_in, expanded):
+            names.extend(row_names)
+            rows.extend([r] * len(row_names))
+        if processes > 1:
+            pool.close()
+            pool.join()
+            pool = None
 
         # Find duplicate indexes
         print("Find duplicates...")
-        dup = set()
-        for i, r in enumerate(out):
-            name1 = r['search_name']
-            # Get max edit distance
-            max_dist = 0
-            for k, l in enumerate(editlength):
-                if len(name1) > l:
-                    max_dist = k + 1
-            uid1 = r['uniqid']
-            if i not in dup:
-                for j in range(i + 1, len(out)):
-                    name2 = out[j]['search_name']
-                    uid2 = out[j]['uniqid']
-                    if distance(name1, name2) <= max_dist:
-                        if (uid1 != uid2):
-                            # Drop both if from difference uid
-                            dup.add(i)
-                            dup.add(j)
-                        else:
-                            # Drop only one if from same uid
-                            dup.add(j)
-
-        # Remove duplicates (reversed order)
+        if processes > 1:
+            pool = Pool(processes=processes, initializer=init_worker,
+                        initargs=(names, editlength))
+            chunksize = max(1, len(names) // (processes * 4))
+            close = pool.imap(find_close_names, range(len(names)), chunksize)
+        else:
+            init_worker(names, editlength)
+            close = map(find_close_names, range(len(names)))
+        dup = bytearray(len(names))
+        for i, js in enumerate(close):
+            if dup[i]:
+                continue
+            uid1 = rows[i][uid_idx]
+            for j in js:
+                if (uid1 != rows[j][uid_idx]):
+                    # Drop both if from difference uid
+                    dup[i] = 1
+                    dup[j] = 1
+                else:
+                    # Drop only one if from same uid
+                    dup[j] = 1
+        if processes > 1:
+            pool.close()
+            pool.join()
+            pool = None
+
+        # Remove duplicates
         print("De-duplicates...")
-        dup = sorted(list(dup), reverse=True)
-        for i in dup:
-            del out[i]
+        out = [(rows[i], names[i]) for i in range(len(names)) if not dup[i]]
 
         # Write out to output file
         print("Write the output to file: '{0}'".format(outfile))
         o = open(outfile, 'w')
-        writer = csv.DictWriter(o, fieldnames=reader.fieldnames +
-                                ['search_name'])
-        writer.writeheader()
-        for r in out:
-            writer.writerow(r)
+        writer = csv.writer(o)
+        writer.writerow(fieldnames + ['search_name'])
+        if 'search_name' in col:
+            # Existing search_name column gets the new search name too
+            name_idx = col['search_name']
+            for r, name in out:
+                r = r[:]
+                r[name_idx] = name
+                writer.writerow(r + [name])
+        else:
+            writer.writerows(r + [name] for r, name in out)
     except Exception as e:
         traceback.print_exc()
 
     finally:
+        # Workers are stopped also when an error happens
+        if pool is not None:
+            pool.terminate()
+            pool.join()
         if o:
             o.close()
         if f:
@@ -152,7 +303,7 @@ def main(argv=sys.argv[1:]):
 
     print(args)
   
-    preprocess(args.input, args.patterns, args.outfile, args.editlength, args.drop_patterns)
+    preprocess(args.input, args.patterns, args.outfile, args.editlength, args.drop_patterns, args.processes)
 
     return 0
 
@@ -10,26 +10,26 @@ import ctypes
 import argparse
 import logging
 import csv
-import gzip
-import six
-from six.moves import range
-try:
-    csv.field_size_limit(int(ctypes.c_ulong(-1).value // 2))
-except:
-    csv.field_size_limit(int(ctypes.c_ulong(-1).value // 2))
+import io
+import shutil
+import subprocess
 import time
 import signal
 
-from six.moves.configparser import ConfigParser
+try:
+    from isal import igzip as gzip
+except ImportError:
+    import gzip
+
 from .searchengines import (SearchMultipleKeywords, NewSearchMultipleKeywords,
                            RESULT_FIELDS)
 
-from multiprocessing import (Pool, TimeoutError)
-from multiprocessing.managers import SyncManager
-from queue import Empty
+from multiprocessing import Pool, Value
 
 from . import utils
 
+csv.field_size_limit(int(ctypes.c_ulong(-1).value // 2))
+
 
 """ Defaults declaration
 """
@@ -37,6 +37,12 @@ MAX_NAME = 20
 LOG_FILE = 'search_names.log'
 DEF_OUTPUT_FILE = 'search_results.csv'
 NUM_PROCESSES = 4
+CHUNK_SIZE = 1000
+CHUNK_TEXT_SIZE = 1 << 18
+CHUNKS_PER_TASK = 4
+READ_BUFFER_SIZE = 1 << 20
+WRITE_BUFFER_SIZE = 1 << 20
+PROGRESS_CHUNKS = 10
 
 DEFAULT_TXT_COLNAME = 'text'
 DEFAULT_INPUT_COLS = ['uniqid', 'text']
@@ -46,16 +52,8 @@ DEFAULT_NAME_FILE = 'deduped_augmented_clean_names.csv'
 DEFAULT_COL_ID = 'uniqid'
 DEFAULT_COL_SEARCH = 'search_name'
 
-
-class WorkAroundManager(SyncManager):
-    @staticmethod
-    def _finalize_manager(process, address, authkey, state, _Client):
-        try:
-            SyncManager._finalize_manager(process, address, authkey, state,
-                                          _Client)
-        except WindowsError:
-            # http://stackoverflow.com/questions/17076679/windowserror-access-is-denied-on-calling-process-terminate
-            pass
+# Search engine of the worker process, set by init_worker()
+_namesearch = None
 
 
 def setup_logger(debug):
@@ -138,6 +136,12 @@ def parse_command_line(argv):
 
     parser.set_defaults(clean=False)
 
+    parser.add_argument('--pin-cpus', dest='pin_cpus',
+                        action='store_true',
+                        help='Pin each search process on its own CPU')
+
+    parser.set_defaults(pin_cpus=False)
+
     return parser.parse_args(argv)
 
 
@@ -156,71 +160,145 @@ def load_names_file(namefile, col_id=DEFAULT_COL_ID, col_search=DEFAULT_COL_SEAR
 
 
 def clean_text(s):
-    s = utils.to_lower_case(s)
-    s = utils.remove_special_chars(s)
+    """Same as applying utils.to_lower_case(), remove_special_chars(),
+       remove_accents(), remove_stopwords(), remove_punctuation() and
+       remove_extra_space() in turn, with fewer passes over the text
+    """
+    s = s.lower().translate(utils.SPECIAL_CHARS_TABLE)
     s = utils.remove_accents(s)
-    s = utils.remove_stopwords(s)
-    s = utils.remove_punctuation(s)
-    s = utils.remove_extra_space(s)
-    return s
+    swords = utils.get_stopwords()
+    table = utils.PUNCTUATION_TABLE
+    words = [w.translate(table) for w in utils.re_words.findall(s)
+             if w not in swords]
+    return ' '.join(w for w in words if w)
 
 
-def init_worker():
+def init_worker(namesearch, cpus=None, counter=None):
+    global _namesearch
     signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _namesearch = namesearch
+    if cpus:
+        # Pin each worker on its own CPU (in turn)
+        with counter.get_lock():
+            idx = counter.value
+            counter.value += 1
+        os.sched_setaffinity(0, [cpus[idx % len(cpus)]])
+
+
+class PipeReader(io.TextIOWrapper):
+    """Text stream over the output of a command, close() waits for the
+       command and raises IOError if it failed
+    """
+    def __init__(self, cmd):
+        self.cmd = cmd
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                     bufsize=READ_BUFFER_SIZE)
+        super(PipeReader, self).__init__(self.proc.stdout, encoding='utf-8')
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            super(PipeReader, self).close()
+        finally:
+            rc = self.proc.wait()
+        # Killed by SIGPIPE only when closed before the end of the output
+        if rc > 0 or (rc < 0 and rc != -signal.SIGPIPE):
+            raise IOError("'{0}' failed (exit status {1:d})"
+                          .format(' '.join(self.cmd), rc))
+
+
+def open_input(filename):
+    """Open CSV input file (plain or gzipped) for reading with a large buffer
+
+       Gzipped input is decompressed by pigz in a separate process when it is
+       available (otherwise by ISA-L igzip or gzip), so that decompression
+       runs alongside CSV parsing
+    """
+    if filename.endswith('.gz'):
+        pigz = shutil.which('pigz')
+        if pigz:
+            return PipeReader([pigz, '-dc', filename])
+        raw = io.BufferedReader(gzip.open(filename, 'rb'),
+                                buffer_size=READ_BUFFER_SIZE)
+        return io.TextIOWrapper(raw, encoding='utf-8')
+    return open(filename, 'rt', encoding='utf-8', buffering=READ_BUFFER_SIZE)
+
+
+def iter_chunks(reader, size=CHUNK_SIZE, text_idx=None,
+                text_size=CHUNK_TEXT_SIZE, width=0):
+    """Yield rows from reader in lists of (at most) size rows
+
+       If text_idx is given, a chunk is also closed once the text column of
+       its rows adds up to text_size characters, so that chunks of long texts
+       get fewer rows and the work per chunk stays about the same. Rows
+       shorter than width are padded with empty fields.
+    """
+    chunk = []
+    n = 0
+    for r in reader:
+        if not r:
+            # skip blank line
+            continue
+        if len(r) < width:
+            r += [''] * (width - len(r))
+        chunk.append(r)
+        if text_idx is not None:
+            n += len(r[text_idx])
+        if len(chunk) >= size or n >= text_size:
+            yield chunk
+            chunk = []
+            n = 0
+    if chunk:
+        yield chunk
 
 
 def worker(args):
-    try:
-        args, pid = args
-        logging.info('[{0}] worker start'.format(pid))
-        namesearch = NewSearchMultipleKeywords(args.names, args.editlength)
-        _open = gzip.open if args.input.endswith('.gz') else open
-        with _open(args.input, 'rt', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            count = 0
-            for i, r in enumerate(reader):
-                if (i % args.processes) != pid:
-                    continue
-                text = r[args.text]
-                if args.clean:
-                    # clean text if need
-                    text = clean_text(text)
-                start = time.time()
-                # Search and matching for nameslist
-                result, n = namesearch.search(text, args.max_name)
-                c = []
-                for k in reader.fieldnames:
-                    if k in args.input_cols:
-                        if args.clean and k == args.text:
-                            # replace original text with cleaned text
-                            c.append(text)
-                        else:
-                            c.append(r[k])
-                sel_result = []
-                for i, r in enumerate(result):
-                    k = RESULT_FIELDS[i % len(RESULT_FIELDS)]
-                    if k in args.search_cols:
-                        sel_result.append(r)
-                c.extend(sel_result)
-                if 'count' in args.search_cols:
-                    c.append(n)
-                elaspe = time.time() - start
-                logging.debug("[{0}] found: {1} in {2:0.3f}s".format(pid, n, elaspe))
-                args.result_queue.put(c)
-                count += 1
-        logging.info('[{0}] worker stop'.format(pid))
-    except:
-        import traceback
-        traceback.print_exc()
+    """Searches a chunk of rows, returns the number of rows and their output
+       rows as CSV text
+    """
+    out = []
+    args, rows = args
+    pid = os.getpid()
+    namesearch = _namesearch
+    result_idx = args.result_idx
+    want_count = args.want_count
+    texts = [r[args.text_idx] for r in rows]
+    if args.clean:
+        # clean text if need
+        texts = [clean_text(text) for text in texts]
+    start = time.monotonic()
+    # Search and matching for nameslist, all the rows of the chunk at once
+    results = namesearch.search_many(texts, args.max_name)
+    elaspe = time.monotonic() - start
+    for r, text, (result, n) in zip(rows, texts, results):
+        c = [r[i] for i in args.input_idx]
+        if args.clean and args.text_pos is not None:
+            # replace original text with cleaned text
+            c[args.text_pos] = text
+        if result_idx is None:
+            c.extend(result)
+        else:
+            c.extend([result[i] for i in result_idx])
+        if want_count:
+            c.append(n)
+        out.append(c)
+    logging.debug("[%d] searched: %d rows in %0.3fs",
+                  pid, len(rows), elaspe)
 
-    return count
+    # One UTF-8 encoded string is cheaper to send back than the nested
+    # lists, and encoding it here spares the main process
+    buf = io.StringIO()
+    csv.writer(buf, dialect='excel').writerows(out)
+    return len(out), buf.getvalue().encode('utf-8')
 
 
 def search_names(input, text=DEFAULT_TXT_COLNAME,
                  input_cols=DEFAULT_INPUT_COLS, names=[],
                  search_cols=DEFAULT_SEARCH_OUTPUT_COLS, max_name=MAX_NAME,
                  editlength=DEFAULT_EDITLENGTH, outfile=DEF_OUTPUT_FILE,
-                 overwritten=False, processes=NUM_PROCESSES, clean=True):
+                 overwritten=False, processes=NUM_PROCESSES, clean=True,
+                 pin_cpus=False):
     logging.info("Setting up, please wait...")
 
     args = argparse.Namespace()
@@ -228,7 +306,6 @@ def search_names(input, text=DEFAULT_TXT_COLNAME,
     args.input = input
     args.text = text
     args.input_cols = input_cols
-    args.names = names
     args.search_cols = search_cols
     args.max_name = max_name
     args.editlength = editlength
@@ -244,73 +321,109 @@ def search_names(input, text=DEFAULT_TXT_COLNAME,
     """Create output file
     """
     try:
+        # Rows come back from the workers already encoded in UTF-8
         if not os.path.exists(args.outfile) or args.overwritten:
-            csvfile = open(args.outfile, 'w', encoding='utf-8')
+            csvfile = open(args.outfile, 'wb', buffering=WRITE_BUFFER_SIZE)
         else:
-            csvfile = open(args.outfile, 'a', encoding='utf-8')
+            csvfile = open(args.outfile, 'ab', buffering=WRITE_BUFFER_SIZE)
             new_outfile = False
-        csvwriter = csv.writer(csvfile, dialect='excel', delimiter=',',
-                               quotechar='"', quoting=csv.QUOTE_MINIMAL)
     except:
         logging.error("Cannot create output file")
         return -1
 
     count = 0
-    all_start = time.time()
+    all_start = time.monotonic()
 
-    # Setting CSV header row
-    if new_outfile:
-        _open = gzip.open if args.input.endswith('.gz') else open
-        with _open(args.input, 'rt') as f:
-            reader = csv.DictReader(f)
+    # Open the input file once, header row and rows are read from it
+    f = open_input(args.input)
+    pool = None
+    try:
+        reader = csv.reader(f)
+        fieldnames = next(reader)
+        args.text_idx = fieldnames.index(args.text)
+        args.input_idx = [i for i, k in enumerate(fieldnames)
+                          if k in args.input_cols]
+        if args.text_idx in args.input_idx:
+            args.text_pos = args.input_idx.index(args.text_idx)
+        else:
+            args.text_pos = None
+        # Positions of the selected fields in the search result (None if
+        # all)
+        if all(a in args.search_cols for a in RESULT_FIELDS):
+            args.result_idx = None
+        else:
+            n_fields = len(RESULT_FIELDS)
+            args.result_idx = [i for i in range(args.max_name * n_fields)
+                               if RESULT_FIELDS[i % n_fields]
+                               in args.search_cols]
+        args.want_count = 'count' in args.search_cols
+
+        # Setting CSV header row
+        if new_outfile:
             """Write output file headers
             """
-            h = []
-            for k in reader.fieldnames:
-                if k in args.input_cols:
-                    h.append(k)
+            h = [fieldnames[i] for i in args.input_idx]
             for i in range(args.max_name):
                 for a in RESULT_FIELDS:
                     if a in args.search_cols:
                         h.append('name{0:d}.{1!s}'.format(i + 1, a))
             if 'count' in args.search_cols:
                 h.append('count')
-            csvwriter.writerow(h)
-
-    # Setting up multiprocessing worker
-    manager = WorkAroundManager()
-    manager.start()
-    # FIXME: Limit memory usage by set maxsize to twice a number of processes.
-    args.result_queue = manager.Queue(args.processes * 2)
-    pool = Pool(processes=args.processes, initializer=init_worker)
-    result = pool.map_async(worker,
-                            [(args, pid) for pid in range(args.processes)])
-
-    # Getting the result from worker processes though share queue
-    progress = 0
-    while True:
+            buf = io.StringIO()
+            csv.writer(buf, dialect='excel', delimiter=',', quotechar='"',
+                       quoting=csv.QUOTE_MINIMAL).writerow(h)
+            csvfile.write(buf.getvalue().encode('utf-8'))
+
+        # Setting up multiprocessing worker
+        # Build the search engine once, forked workers share it
+        namesearch = NewSearchMultipleKeywords(names, args.editlength)
+        cpus = None
+        counter = None
+        if pin_cpus:
+            if hasattr(os, 'sched_setaffinity'):
+                cpus = sorted(os.sched_getaffinity(0))
+                counter = Value('i', 0)
+            else:
+                logging.warning("CPU affinity is not supported on this"
+                                " platform")
+        pool = Pool(processes=args.processes, initializer=init_worker,
+                    initargs=(namesearch, cpus, counter))
+
+        # Feed the workers with chunks of rows read lazily from the input
+        # file, sized by the amount of text to search, several chunks per
+        # round trip, and write the results back in order
+        jobs = ((args, rows) for rows in iter_chunks(reader, CHUNK_SIZE,
+                                                     args.text_idx,
+                                                     width=len(fieldnames)))
+        done = 0
+        last_time, last_count = all_start, 0
         try:
-            r = args.result_queue.get(timeout=0.1)
-            csvwriter.writerow(r)
-            progress += 1
-            elaspe = time.time() - all_start
-            logging.info("Progress: {0:d}, Average rate = {1:.0f} rows/min"
-                          .format(progress, progress * 60 / elaspe))
+            for n, out in pool.imap(worker, jobs, chunksize=CHUNKS_PER_TASK):
+                csvfile.write(out)
+                count += n
+                done += 1
+                if done % PROGRESS_CHUNKS == 0:
+                    now = time.monotonic()
+                    logging.info("Progress: {0:d}, Average rate = {1:.0f}"
+                                 " rows/min, Current rate = {2:.0f} rows/min"
+                                 .format(count, count * 60 / (now - all_start),
+                                         (count - last_count) * 60 /
+                                         (now - last_time)))
+                    last_time, last_count = now, count
         except KeyboardInterrupt:
-            break
-        except Empty:
-            try:
-                done = result.get(timeout=0.1)
-                count = sum(done)
-                break
-            except TimeoutError:
-                pass
-    pool.terminate()
-    pool.join()
-    elaspe = time.time() - all_start
+            pass
+    finally:
+        # Stop the workers and close the files, also on error
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        try:
+            f.close()
+        finally:
+            csvfile.close()
+    elaspe = time.monotonic() - all_start
     logging.info("Total: {0:d}, Average rate = {1:.0f} rows/min"
                  .format(count, count * 60 / elaspe))
-    csvfile.close()
 
 
 def main(argv=sys.argv[1:]):
@@ -325,7 +438,8 @@ def main(argv=sys.argv[1:]):
 
     search_names(args.input, args.text, args.input_cols, names,
                  args.search_cols, args.max_name, args.editlength,
-                 args.outfile, args.overwritten, args.processes, args.clean)
+                 args.outfile, args.overwritten, args.processes, args.clean,
+                 args.pin_cpus)
 
     return 0
 
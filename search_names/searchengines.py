@@ -6,9 +6,20 @@ Using `regex` instead of Python built-in `re` module.
 
 """
 import regex as re
-from Levenshtein import distance
+from rapidfuzz.distance.Levenshtein import distance
+from rapidfuzz.process import extract_iter
 import time
 import csv
+from bisect import bisect_right
+
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
 
 """Constant declaration
 """
@@ -16,6 +27,9 @@ MAX_RESULT = 20
 DEF_INPUT_FILE = 'deduped_augmented_clean_names.csv'
 RESULT_FIELDS = ['uniqid', 'n', 'match', 'start', 'end']
 
+re_word = re.compile(r'\w')
+SEPARATOR_CHAR = '\x00'  # joins the texts searched at once
+
 class SearchMultipleKeywords(object):
     """Search by multiple keywords list
     """
@@ -25,6 +39,7 @@ class SearchMultipleKeywords(object):
         if fuzzy_min_len is None:
             fuzzy_min_len = []
         self.fuzzy_min_len = sorted(fuzzy_min_len)
+        self.allow_distance = {}  # keyword length ==> allowed distance
         self.keywords = {}
         for i, k in keywords:
             if i not in self.keywords:
@@ -49,11 +64,16 @@ class SearchMultipleKeywords(object):
             self.re_keywords[i] = re.compile(re_str, flags=re.I)
 
     def get_allow_distance(self, k):
-        dist = 0
-        for l, d in self.fuzzy_min_len:
-            if len(k) > l:
-                dist = d
-        return dist
+        """Returns the allowed edit distance of the keyword (by its length)
+        """
+        n = len(k)
+        if n not in self.allow_distance:
+            dist = 0
+            for l, d in self.fuzzy_min_len:
+                if n > l:
+                    dist = d
+            self.allow_distance[n] = dist
+        return self.allow_distance[n]
 
     def search(self, s, n=MAX_RESULT):
         """Search
@@ -73,19 +93,15 @@ class SearchMultipleKeywords(object):
 
         j = 0
         for k in match:
-            c.extend([k, len(match[k]), ';'.join([m[0] for m in match[k]]),
-                      ';'.join([str(m[1]) for m in match[k]]),
-                      ';'.join([str(m[2]) for m in match[k]])])
+            names, starts, ends = zip(*match[k])
+            c.extend([k, len(names), ';'.join(names),
+                      ';'.join(map(str, starts)), ';'.join(map(str, ends))])
             j += 1
             if j >= n:
                 break
-        while j < n:
-            for a in RESULT_FIELDS:
-                c.append('')
-            j += 1
-        count = 0
-        for m in match:
-            count += len(match[m])
+        # Empty fields of the remaining results
+        c.extend([''] * (len(RESULT_FIELDS) * (n - j)))
+        count = sum(len(m) for m in match.values())
 
         return c, count
 
@@ -100,6 +116,7 @@ class NewSearchMultipleKeywords(object):
         if fuzzy_min_len is None:
             fuzzy_min_len = []
         self.fuzzy_min_len = sorted(fuzzy_min_len)
+        self.allow_distance = {}  # keyword length ==> allowed distance
         self.keywords = {}
         for i, k in keywords:
             k = k.strip().lower()
@@ -111,6 +128,19 @@ class NewSearchMultipleKeywords(object):
         print("Number of unique keywords ID to be searched: {0}"
               .format(len(self.keywords)))
 
+        # Keywords by length as parallel lists of their orders and keywords,
+        # a keyword can only be within its allowed distance of the keys of
+        # close length
+        self.keywords_by_len = {}
+        for r, k in enumerate(self.keywords):
+            if len(k) not in self.keywords_by_len:
+                self.keywords_by_len[len(k)] = ([], [])
+            orders, keys = self.keywords_by_len[len(k)]
+            orders.append(r)
+            keys.append(k)
+        self.max_allow_distance = max([d for l, d in self.fuzzy_min_len] +
+                                      [0])
+
         kw = []
         for k in self.keywords:
             d = self.get_allow_distance(k)
@@ -123,32 +153,154 @@ class NewSearchMultipleKeywords(object):
         re_str = r'\b(?:{0})\b'.format(re_str)
         self.re_keywords = re.compile(re_str)
 
+        self.joinable = not any(SEPARATOR_CHAR in k for k in self.keywords)
+
+        # Without fuzzy keywords the regex is a plain alternation of words
+        # which a multiple literals matcher finds much faster
+        self.exact_keywords = None
+        self.exact_matcher = None
+        if (self.keywords and '' not in self.keywords and
+                all(self.get_allow_distance(k) == 0 for k in self.keywords)):
+            self.exact_keywords = list(self.keywords)
+            self.build_exact_matcher()
+
+    def __getstate__(self):
+        # The compiled matcher can't be pickled, rebuilt when unpickled
+        state = self.__dict__.copy()
+        state['exact_matcher'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.exact_keywords is not None:
+            self.build_exact_matcher()
+
+    def build_exact_matcher(self):
+        """Compile the exact keywords into a Hyperscan database, or else an
+           Aho-Corasick automaton (if either is available)
+        """
+        if hyperscan is None:
+            if ahocorasick is not None:
+                automaton = ahocorasick.Automaton()
+                for r, k in enumerate(self.exact_keywords):
+                    automaton.add_word(k, r)
+                automaton.make_automaton()
+                self.exact_matcher = automaton
+            return
+        # Matched as UTF-32 so that the offsets map back to the characters
+        expressions = [''.join('\\x{0:02x}'.format(b)
+                               for b in k.encode('utf-32-le')).encode()
+                       for k in self.exact_keywords]
+        try:
+            db = hyperscan.Database()
+            db.compile(expressions=expressions,
+                       ids=list(range(len(expressions))),
+                       elements=len(expressions),
+                       flags=[0] * len(expressions))
+        except Exception as e:
+            print("WARNING: cannot build Hyperscan database ({0}), "
+                  "fall back to regex".format(e))
+            return
+        self.exact_matcher = db
+
+    def scan_exact_keywords(self, s):
+        """Returns (keyword order, start, end) of all the (overlapping)
+           exact keywords occurrences in s
+        """
+        found = []
+        if not s:
+            return found
+        keywords = self.exact_keywords
+        if hyperscan is None:
+            for end, r in self.exact_matcher.iter(s):
+                found.append((r, end + 1 - len(keywords[r]), end + 1))
+            return found
+
+        def on_match(r, start, end, flags, context):
+            if end % 4 == 0:
+                end //= 4
+                found.append((r, end - len(keywords[r]), end))
+
+        self.exact_matcher.scan(s.encode('utf-32-le'),
+                                match_event_handler=on_match)
+        return found
+
+    def exact_finditer(self, s):
+        """Returns (start, end) of the same matches as re_keywords.finditer()
+           when all the keywords are exact
+        """
+        def is_boundary(i):
+            before = i > 0 and re_word.match(s, i - 1) is not None
+            after = i < len(s) and re_word.match(s, i) is not None
+            return before != after
+
+        # The regex takes the first alternative matching at a position
+        first = {}
+        for r, start, end in self.scan_exact_keywords(s):
+            if start in first and first[start][0] < r:
+                continue
+            if is_boundary(start) and is_boundary(end):
+                first[start] = (r, end)
+        # and resumes from the end of the match
+        out = []
+        last = 0
+        for start in sorted(first):
+            if start >= last:
+                last = first[start][1]
+                out.append((start, last))
+        return out
+
     def get_allow_distance(self, k):
-        dist = 0
-        for l, d in self.fuzzy_min_len:
-            if len(k) > l:
-                dist = d
-        return dist
+        """Returns the allowed edit distance of the keyword (by its length)
+        """
+        n = len(k)
+        if n not in self.allow_distance:
+            dist = 0
+            for l, d in self.fuzzy_min_len:
+                if n > l:
+                    dist = d
+            self.allow_distance[n] = dist
+        return self.allow_distance[n]
 
     def find_nearest_key(self, key):
-        for k in self.keywords:
-            d = self.get_allow_distance(k)
-            if distance(k, key) <= d:
-                return k
+        """Returns the first keyword within its allowed distance of the key
+        """
+        nearest = None
+        m = self.max_allow_distance
+        for l in range(len(key) - m, len(key) + m + 1):
+            if l not in self.keywords_by_len:
+                continue
+            orders, keys = self.keywords_by_len[l]
+            # All the keywords of the bucket have the same allowed distance
+            d = self.get_allow_distance(keys[0])
+            if abs(l - len(key)) > d:
+                continue
+            # First keyword of the bucket within the distance (in order)
+            for _, _, i in extract_iter(key, keys, scorer=distance,
+                                        processor=None, score_cutoff=d):
+                if nearest is None or orders[i] < nearest[0]:
+                    nearest = (orders[i], keys[i])
+                break
+        if nearest is not None:
+            return nearest[1]
 
-    def search(self, s, n=MAX_RESULT):
-        """Search
+    def finditer(self, s):
+        """Returns (matched text, start, end) of the keywords matches in s
         """
-        c = []
-        if n == 0:
-            return c
+        if self.exact_matcher is not None:
+            return [(s[b:e], b, e) for b, e in self.exact_finditer(s)]
+        return [(a.group(0), a.start(0), a.end(0))
+                for a in self.re_keywords.finditer(s)]
 
-        j = 0
+    def get_result(self, found, n=MAX_RESULT):
+        """Returns the result row and the total count of the matches found
+        """
+        c = []
         match = dict()
-        for a in self.re_keywords.finditer(s):
-            fkey = a.group(0).strip()
+        for g, start, end in found:
+            fkey = g.strip()
             if fkey not in self.keywords:
-                fkey = a.group(0)
+                fkey = g
                 nearestkey = self.find_nearest_key(fkey)
                 #print("Approximate match '%s' ==> '%s'" % (fkey, nearestkey))
                 key = nearestkey
@@ -156,28 +308,56 @@ class NewSearchMultipleKeywords(object):
                 key = fkey
             rowid = self.keywords[key]
             if rowid in match:
-                match[rowid].append((fkey, a.start(0), a.end(0)))
+                match[rowid].append((fkey, start, end))
             else:
-                match[rowid] = [(fkey, a.start(0), a.end(0))]
+                match[rowid] = [(fkey, start, end)]
 
         j = 0
         for k in match:
-            c.extend([k, len(match[k]), ';'.join([m[0] for m in match[k]]),
-                      ';'.join([str(m[1]) for m in match[k]]),
-                      ';'.join([str(m[2]) for m in match[k]])])
+            names, starts, ends = zip(*match[k])
+            c.extend([k, len(names), ';'.join(names),
+                      ';'.join(map(str, starts)), ';'.join(map(str, ends))])
             j += 1
             if j >= n:
                 break
-        while j < n:
-            for a in RESULT_FIELDS:
-                c.append('')
-            j += 1
-        count = 0
-        for m in match:
-            count += len(match[m])
+        # Empty fields of the remaining results
+        c.extend([''] * (len(RESULT_FIELDS) * (n - j)))
+        count = sum(len(m) for m in match.values())
 
         return c, count
 
+    def search(self, s, n=MAX_RESULT):
+        """Search
+        """
+        c = []
+        if n == 0:
+            return c
+
+        return self.get_result(self.finditer(s), n)
+
+    def search_many(self, texts, n=MAX_RESULT):
+        """Search several texts in one pass, returns the list of the search()
+           results of the texts
+        """
+        # Only exact keywords are searched over the joined texts, a match
+        # can't take in the (non-word) separator then. Fuzzy matches of the
+        # regex may differ once the texts are joined.
+        sep = SEPARATOR_CHAR
+        if (n == 0 or self.exact_keywords is None or not self.joinable or
+                any(sep in s for s in texts)):
+            return [self.search(s, n) for s in texts]
+
+        starts = []
+        pos = 0
+        for s in texts:
+            starts.append(pos)
+            pos += len(s) + len(sep)
+        found = [[] for s in texts]
+        for g, start, end in self.finditer(sep.join(texts)):
+            i = bisect_right(starts, start) - 1
+            found[i].append((g, start - starts[i], end - starts[i]))
+        return [self.get_result(f, n) for f in found]
+
 
 if __name__ == "__main__":
     
@@ -200,7 +380,7 @@ if __name__ == "__main__":
                 result_header.append('name{0}.{1}'.format(i + 1, j))
         result_header.append('count')
         writer.writerow(result_header)
-        start_time = time.time()
+        start_time = time.monotonic()
         for i, r in enumerate(reader):
             uid = r['uniqid']
             text = r['text']
@@ -209,7 +389,7 @@ if __name__ == "__main__":
             c.extend(result)
             c.append(count)
             writer.writerow(c)
-        elaspe = time.time() - start_time
+        elaspe = time.monotonic() - start_time
         print("Average rate = {0:f} rows/min".format((i * 60 / elaspe)))
     out.close()
 
@@ -226,7 +406,7 @@ if __name__ == "__main__":
                 result_header.append('name{0}.{1}'.format(i + 1, j))
         result_header.append('count')
         writer.writerow(result_header)
-        start_time = time.time()
+        start_time = time.monotonic()
         for i, r in enumerate(reader):
             uid = r['uniqid']
             text = r['text']
@@ -235,6 +415,6 @@ if __name__ == "__main__":
             c.extend(result)
             c.append(count)
             writer.writerow(c)
-        elaspe = time.time() - start_time
+        elaspe = time.monotonic() - start_time
         print("Average rate = {0:f} rows/min".format((i * 60 / elaspe)))
     out.close()
@@ -7,17 +7,21 @@ import ctypes
 import argparse
 import logging
 import csv
-from csv import DictWriter, DictReader
 import sys
 
 try:
-    csv.field_size_limit(int(ctypes.c_ulong(-1).value // 2))
-except:
-    csv.field_size_limit(int(ctypes.c_ulong(-1).value // 2))
+    from isal import igzip as gzip
+except ImportError:
+    import gzip
+
+csv.field_size_limit(int(ctypes.c_ulong(-1).value // 2))
 
 LOG_FILE = 'split_text_corpus.log'
-DEFAULT_OUTPUT_FORMAT = 'chunk_{chunk_id:02d}/{basename}.csv'
+DEFAULT_OUTPUT_FORMAT = 'chunk_{chunk_id:02d}/{basename}.csv.gz'
 DEFAULT_CHUNK_SIZE = 1000
+READ_BUFFER_SIZE = 1 << 20
+WRITE_BUFFER_SIZE = 1 << 20
+GZIP_COMPRESS_LEVEL = 1
 
 
 def setup_logger():
@@ -34,40 +38,66 @@ def setup_logger():
     console.setFormatter(formatter)
     logging.getLogger('').addHandler(console)
 
+def open_chunk(chunk_name):
+    """Open chunk file for writing, gzipped if its name ends with .gz
+    """
+    if chunk_name.endswith('.gz'):
+        return gzip.open(chunk_name, 'wt', encoding='utf-8', newline='',
+                         compresslevel=GZIP_COMPRESS_LEVEL)
+    return open(chunk_name, 'w', newline='', buffering=WRITE_BUFFER_SIZE)
+
+
 def split_text_corpus(infile=None, outfile=None, size=1000):
-    with open(infile, 'r') as f:
-        reader = DictReader(f)
-        header = reader.fieldnames
-        if 'uniqid' not in header:
-            add_uid = True
-            header.append('uniqid')
-        else:
-            add_uid = False
-        chunk_id = 0
-        count = 0
-        uid = 0
-        for r in reader:
-            if count == 0:
-                filename = splitext(basename(infile))[0]
-                chunk_name = outfile.format(basename=filename,
-                                                 chunk_id=chunk_id)
-                logging.info("Create new chunk: {0}, filename: {1}"
-                             .format(chunk_id, chunk_name))
-                d = dirname(chunk_name)
-                if not os.path.exists(d):
-                    os.makedirs(d)
-                out = open(chunk_name, 'w')
-                writer = DictWriter(out, fieldnames=header)
-                writer.writeheader()
-            if add_uid:
-                r['uniqid'] = uid
-            writer.writerow(r)
-            count += 1
-            if count >= size:
-                count = 0
-                chunk_id += 1
-                out.close()
-            uid += 1
+    out = None
+    try:
+        with open(infile, 'r', newline='',
+                  buffering=READ_BUFFER_SIZE) as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            n_fields = len(header)
+            if 'uniqid' not in header:
+                add_uid = True
+                header.append('uniqid')
+            else:
+                add_uid = False
+            chunk_id = 0
+            count = 0
+            uid = 0
+            for r in reader:
+                if not r:
+                    continue
+                if len(r) < n_fields:
+                    r += [''] * (n_fields - len(r))
+                elif len(r) > n_fields:
+                    # as csv.DictWriter did, rather than misplace the uniqid
+                    raise ValueError("Row #{0:d} has more fields than the"
+                                     " header".format(uid))
+                if count == 0:
+                    filename = splitext(basename(infile))[0]
+                    chunk_name = outfile.format(basename=filename,
+                                                chunk_id=chunk_id)
+                    logging.info("Create new chunk: {0}, filename: {1}"
+                                 .format(chunk_id, chunk_name))
+                    d = dirname(chunk_name)
+                    if d and not os.path.exists(d):
+                        os.makedirs(d)
+                    out = open_chunk(chunk_name)
+                    writer = csv.writer(out)
+                    writer.writerow(header)
+                if add_uid:
+                    r.append(uid)
+                writer.writerow(r)
+                count += 1
+                if count >= size:
+                    count = 0
+                    chunk_id += 1
+                    out.close()
+                    out = None
+                uid += 1
+    finally:
+        # Last chunk is not full
+        if out is not None:
+            out.close()
 
 
 def main(argv=sys.argv[1:]):
@@ -83,7 +113,8 @@ def main(argv=sys.argv[1:]):
 
     parser.add_argument("-o", "--out", type=str, dest="outfile",
                         default=DEFAULT_OUTPUT_FORMAT,
-                        help="Output file in CSV (default: {0:s})"
+                        help="Output file in CSV, gzipped if ends with .gz"
+                        " (default: {0:s})"
                         .format(DEFAULT_OUTPUT_FORMAT))
     parser.add_argument('-s', '--size', type=int, default=DEFAULT_CHUNK_SIZE,
                         help='Number of row in each chunk (default: {0:d})'
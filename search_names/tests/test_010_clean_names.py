@@ -6,6 +6,7 @@ Tests for secc_caste_ln.py
 """
 
 import os
+import csv
 import shutil
 import unittest
 from search_names import clean_names
@@ -25,6 +26,35 @@ class TestCleanNames(unittest.TestCase):
         clean_names(self.input)
         self.assertTrue(os.path.exists(self.output))
 
+    def test_short_rows(self):
+        names = 'short_rows_names.csv'
+        with open(names, 'w') as f:
+            f.write('Name,seat,party\n'
+                    '"HALL, GUS",federal:president,328\n'
+                    '"UDALL, MORRIS K.",federal:president\n')
+        try:
+            clean_names(names, self.output)
+        finally:
+            os.unlink(names)
+        with open(self.output) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual([r['party'] for r in rows], ['328', ''])
+        self.assertEqual([r['uniqid'] for r in rows], ['1', '2'])
+
+    def test_existing_columns(self):
+        names = 'existing_columns_names.csv'
+        with open(names, 'w') as f:
+            f.write('Name,seat,uniqid\n'
+                    '"HALL, GUS",federal:president,99\n')
+        try:
+            clean_names(names, self.output)
+        finally:
+            os.unlink(names)
+        with open(self.output) as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0][:4], ['Name', 'seat', 'uniqid', 'uniqid'])
+        self.assertEqual(rows[1][2:5], ['1', '1', 'GUS'])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -6,9 +6,11 @@ Tests for secc_caste_ln.py
 """
 
 import os
+import csv
 import shutil
 import unittest
 from search_names import preprocess
+from search_names.preprocess import load_drop_patterns
 from . import capture
 
 
@@ -25,6 +27,54 @@ class TestPreprocess(unittest.TestCase):
         preprocess(self.input, drop_patterns=['Barak Obama', 'Michael Jackson'])
         self.assertTrue(os.path.exists(self.output))
 
+    def test_load_drop_patterns(self):
+        with open(self.output, 'w') as f:
+            f.write('Barak Obama\n\n  michael JACKSON \n')
+        self.assertEqual(load_drop_patterns(self.output),
+                         frozenset(['barak obama', 'michael jackson']))
+
+    def test_short_rows(self):
+        names = 'short_rows_names.csv'
+        with open(names, 'w') as f:
+            f.write('uniqid,FirstName,LastName,prefixes,nick_names\n'
+                    '1,gus,hall,president,gussie\n'
+                    '2,morris,udall,senator\n')
+        try:
+            preprocess(names, outfile=self.output)
+        finally:
+            os.unlink(names)
+        with open(self.output) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(sorted(r['search_name'] for r in rows),
+                         ['gus hall', 'gussie hall', 'morris udall',
+                          'president hall', 'senator udall'])
+
+    def test_drop_patterns(self):
+        names = 'drop_patterns_names.csv'
+        with open(names, 'w') as f:
+            f.write('uniqid,FirstName,LastName,prefixes,nick_names\n'
+                    '1,gus,hall,President,Gussie\n')
+        try:
+            preprocess(names, outfile=self.output,
+                       drop_patterns=['President hall', 'gussie HALL'])
+        finally:
+            os.unlink(names)
+        with open(self.output) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual([r['search_name'] for r in rows], ['gus hall'])
+
+    def test_processes(self):
+        # Worker processes give the same output as a single process
+        parallel = 'parallel_' + self.output
+        try:
+            preprocess(self.input, outfile=parallel, editlength=[5, 12],
+                       processes=2)
+            preprocess(self.input, outfile=self.output, editlength=[5, 12])
+            with open(parallel) as f1, open(self.output) as f2:
+                self.assertEqual(f1.read(), f2.read())
+        finally:
+            os.unlink(parallel)
+
 
 if __name__ == '__main__':
     unittest.main()
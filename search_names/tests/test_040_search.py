@@ -6,10 +6,16 @@ Tests for secc_caste_ln.py
 """
 
 import os
+import sys
+import csv
+import gzip
 import shutil
 import unittest
+import multiprocessing
+from unittest import mock
 from search_names import search_names
-from search_names.search_names import load_names_file
+from search_names.searchengines import NewSearchMultipleKeywords
+from search_names.search_names import load_names_file, PipeReader
 from . import capture
 
 
@@ -21,13 +27,67 @@ class TestSearch(unittest.TestCase):
         self.output = 'search_results.csv'
 
     def tearDown(self):
-        os.unlink(self.output)
+        if os.path.exists(self.output):
+            os.unlink(self.output)
 
     def test_clean_names(self):
         names = load_names_file(self.name_file)
         search_names(self.input, names=names)
         self.assertTrue(os.path.exists(self.output))
 
+    def test_short_rows(self):
+        corpus = 'short_rows_corpus.csv'
+        with open(corpus, 'w') as f:
+            f.write('uniqid,text,source\n'
+                    '1,gus hall spoke today,web\n'
+                    '2,then gus hall left\n'
+                    '3\n'
+                    '4,no name here,web\n')
+        try:
+            search_names(corpus, names=[('1', 'gus hall')], clean=False,
+                         processes=1)
+        finally:
+            os.unlink(corpus)
+        with open(self.output) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual([r['uniqid'] for r in rows], ['1', '2', '3', '4'])
+        self.assertEqual([r['count'] for r in rows], ['1', '1', '0', '0'])
+        self.assertEqual(rows[2]['text'], '')
+
+    @unittest.skipUnless(multiprocessing.get_start_method() == 'fork',
+                         'workers only inherit the patched search engine '
+                         'when forked')
+    def test_worker_error(self):
+        names = load_names_file(self.name_file)
+        with mock.patch.object(NewSearchMultipleKeywords, 'search_many',
+                               side_effect=RuntimeError('search failed')):
+            with self.assertRaises(RuntimeError):
+                search_names(self.input, names=names, clean=False,
+                             processes=2)
+
+    def test_truncated_gzip_input(self):
+        corpus = 'truncated_corpus.csv.gz'
+        with open(self.input, 'rb') as f:
+            data = gzip.compress(f.read())
+        with open(corpus, 'wb') as f:
+            f.write(data[:len(data) // 2])
+        try:
+            with self.assertRaises((IOError, EOFError)):
+                search_names(corpus, names=[('1', 'gus hall')], clean=False,
+                             processes=1)
+        finally:
+            os.unlink(corpus)
+
+    def test_pipe_reader_exit_status(self):
+        f = PipeReader([sys.executable, '-c',
+                        'print("uniqid,text"); raise SystemExit(2)'])
+        self.assertEqual(f.read(), 'uniqid,text\n')
+        self.assertRaises(IOError, f.close)
+        f = PipeReader([sys.executable, '-c', 'print("uniqid,text")'])
+        self.assertEqual(f.read(), 'uniqid,text\n')
+        f.close()
+        self.assertEqual(f.proc.returncode, 0)
+
 
 if __name__ == '__main__':
     unittest.main()
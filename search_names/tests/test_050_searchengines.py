@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for searchengines.py
+"""
+
+import io
+import random
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+from search_names import searchengines
+from search_names.searchengines import NewSearchMultipleKeywords
+
+KEYWORDS = [('1', 'gus hall'), ('2', 'gus'), ('3', 'hall smith'),
+            ('4', 'hall'), ('5', 'josé garcía'), ('6', 'müller'),
+            ('7', 'a'), ('8', 'ab'), ('9', 'b a')]
+
+TEXTS = ['',
+         'gus',
+         'gus hall',
+         'gus hall smith',
+         'gus hall smith and hall smith spoke',
+         'gushall gus-hall hall, gus.',
+         'josé garcía met herr müller and müllerin',
+         'señor josé garcía',
+         'müller',
+         'a ab b a ab a b a',
+         'hall',
+         'said gus']
+
+
+class TestExactMatcher(unittest.TestCase):
+
+    def check_same_as_regex(self, backend):
+        """Matches of KEYWORDS on one exact matcher backend are the same as
+           the regex ones
+        """
+        if backend == 'hyperscan' and searchengines.hyperscan is None:
+            self.skipTest('hyperscan is not installed')
+        if backend == 'ahocorasick' and searchengines.ahocorasick is None:
+            self.skipTest('pyahocorasick is not installed')
+        hs = searchengines.hyperscan if backend == 'hyperscan' else None
+        ac = searchengines.ahocorasick if backend == 'ahocorasick' else None
+        rnd = random.Random(7)
+        words = ['gus', 'hall', 'smith', 'a', 'ab', 'b', 'müller', 'josé',
+                 'garcía', ' ', ' ', ',', '-', 'é']
+        texts = TEXTS + [''.join(rnd.choice(words) for _ in range(12))
+                         for _ in range(300)]
+        with mock.patch.multiple(searchengines, hyperscan=hs,
+                                 ahocorasick=ac):
+            with redirect_stdout(io.StringIO()):
+                e = NewSearchMultipleKeywords(KEYWORDS)
+            if backend == 'none':
+                self.assertIsNone(e.exact_matcher)
+            else:
+                self.assertIsNotNone(e.exact_matcher)
+            for s in texts:
+                expected = [(a.group(0), a.start(0), a.end(0))
+                            for a in e.re_keywords.finditer(s)]
+                self.assertEqual(e.finditer(s), expected, s)
+
+    def test_hyperscan(self):
+        self.check_same_as_regex('hyperscan')
+
+    def test_ahocorasick(self):
+        self.check_same_as_regex('ahocorasick')
+
+    def test_none(self):
+        self.check_same_as_regex('none')
+
+
+class TestSearchMany(unittest.TestCase):
+
+    def check_same_as_search(self, e):
+        texts = ['', 'gus hall', '', 'met gus', 'hall smith', 'gus', '',
+                 'hall', 'a', 'b a', 'müller', 'josé garcía said', '']
+        for i in range(len(texts)):
+            # Keywords at the start and end of each text, next to the others
+            batch = texts[i:] + texts[:i]
+            for n in (0, 1, 3):
+                self.assertEqual(e.search_many(batch, n),
+                                 [e.search(s, n) for s in batch])
+        self.assertEqual(e.search_many([''], 3), [e.search('', 3)])
+        self.assertEqual(e.search_many([]), [])
+
+    def test_exact(self):
+        with redirect_stdout(io.StringIO()):
+            e = NewSearchMultipleKeywords(KEYWORDS)
+        self.check_same_as_search(e)
+
+    def test_fuzzy(self):
+        with redirect_stdout(io.StringIO()):
+            e = NewSearchMultipleKeywords(KEYWORDS, [(5, 1)])
+        self.check_same_as_search(e)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for merge_results.py
+"""
+
+import os
+import csv
+import importlib
+import unittest
+from unittest import mock
+from search_names import merge_results
+
+merge_module = importlib.import_module('search_names.merge_results')
+
+
+class TestMergeResults(unittest.TestCase):
+
+    def setUp(self):
+        self.inputs = ['merge_chunk_00.csv', 'merge_chunk_01.csv']
+        self.output = 'merged_search_results.csv'
+
+    def tearDown(self):
+        for f in self.inputs + [self.output]:
+            if os.path.exists(f):
+                os.unlink(f)
+
+    def write_inputs(self, *contents):
+        for name, data in zip(self.inputs, contents):
+            with open(name, 'wb') as f:
+                f.write(data)
+
+    def test_same_header(self):
+        # Rows are copied as they are, a text may hold line breaks
+        self.write_inputs(b'uniqid,text\r\n1,"gus\r\nhall"\r\n2,b\r\n',
+                          b'uniqid,text\r\n3,c\r\n4,"d, e"')
+        merge_results(self.inputs, self.output)
+        with open(self.output, 'rb') as f:
+            self.assertEqual(f.read(), b'uniqid,text\r\n1,"gus\r\nhall"\r\n'
+                             b'2,b\r\n3,c\r\n4,"d, e"\r\n')
+
+    def test_reordered_header(self):
+        rows = [[str(i), 'text {0}\nline'.format(i), str(i % 3)]
+                for i in range(50)]
+        self.write_inputs(b'uniqid,text,count\r\n0,a,1\r\n',
+                          b'count,uniqid,other,text\r\n' +
+                          ''.join('{2},{0},x,"{1}"\r\n'.format(*r)
+                                  for r in rows).encode('utf-8') +
+                          b'\r\n9\r\n')
+        # A small buffer writes the re-ordered rows in several batches
+        with mock.patch.object(merge_module, 'BUFFER_SIZE', 64):
+            merge_results(self.inputs, self.output)
+        with open(self.output, newline='') as f:
+            out = list(csv.reader(f))
+        self.assertEqual(out, [['uniqid', 'text', 'count'], ['0', 'a', '1']] +
+                         rows + [['', '', '9']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tests for split_text_corpus.py
+"""
+
+import os
+import csv
+import glob
+import gzip
+import shutil
+import unittest
+from search_names import split_text_corpus
+
+
+class TestSplitTextCorpus(unittest.TestCase):
+
+    def setUp(self):
+        self.input = 'split_corpus.csv'
+        self.outdir = 'split_chunks'
+        self.output = self.outdir + '/chunk_{chunk_id:02d}/{basename}.csv'
+
+    def tearDown(self):
+        if os.path.exists(self.input):
+            os.unlink(self.input)
+        shutil.rmtree(self.outdir, ignore_errors=True)
+
+    def test_gzip_chunks(self):
+        with open(self.input, 'w') as f:
+            f.write('text,source\n')
+            for i in range(7):
+                f.write('"text {0}\nline",web\n'.format(i))
+            f.write('\n')
+        split_text_corpus(self.input, self.output + '.gz', 3)
+        chunks = sorted(glob.glob(self.outdir + '/*/split_corpus.csv.gz'))
+        self.assertEqual(len(chunks), 3)
+        rows = []
+        for c in chunks:
+            with gzip.open(c, 'rt', newline='') as f:
+                reader = csv.reader(f)
+                self.assertEqual(next(reader), ['text', 'source', 'uniqid'])
+                rows.extend(reader)
+        self.assertEqual([len(r) for r in rows], [3] * 7)
+        self.assertEqual([r[2] for r in rows], [str(i) for i in range(7)])
+        self.assertEqual(rows[6][0], 'text 6\nline')
+
+    def test_long_row(self):
+        with open(self.input, 'w') as f:
+            f.write('text,source\n'
+                    'gus hall spoke,web\n'
+                    'then gus hall left,web,extra\n')
+        with self.assertRaises(ValueError):
+            split_text_corpus(self.input, self.output, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
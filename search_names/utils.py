@@ -5,12 +5,9 @@ import re
 import os
 import string
 import unicodedata
+from functools import lru_cache
 
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import wordpunct_tokenize
-from nltk.stem.porter import PorterStemmer
-from nltk.stem.snowball import EnglishStemmer
+# nltk is imported by the functions that need it, it is slow to import
 #from ntlk.tokenize import sent_tokenize
 """
 1. Convert to lower case
@@ -22,6 +19,12 @@ from nltk.stem.snowball import EnglishStemmer
 7. Handling input and output
 """
 
+# Built once, str.translate() deletes the characters in C
+SPECIAL_CHARS_TABLE = str.maketrans('', '', ''.join(
+    c for c in string.punctuation if c not in '.,?'))
+PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation)
+re_words = re.compile(r'\w+|[^\w\s]+')  # as nltk wordpunct_tokenize()
+
 
 def lower(text):
     """change everything to lowercase
@@ -34,13 +37,32 @@ def to_lower_case(text):
     return lower(text)
 
 
+class AccentsTable(dict):
+    """Translation table deleting combining characters and \\x80-\\xFF,
+       filled in as characters are first seen
+    """
+    def __missing__(self, c):
+        if 0x80 <= c <= 0xFF or unicodedata.combining(chr(c)):
+            v = None
+        else:
+            v = c
+        self[c] = v
+        return v
+
+
+ACCENTS_TABLE = AccentsTable()
+
+
 def remove_accents(text):
     """Remove diacritics
     """
+    try:
+        text.encode('ascii')
+        return text
+    except UnicodeEncodeError:
+        pass
     nkfd_form = unicodedata.normalize('NFKD', text)
-    text = u"".join([c for c in nkfd_form if not unicodedata.combining(c)])
-
-    text = re.sub(r'[\x80-\xFF]', '', text)
+    text = nkfd_form.translate(ACCENTS_TABLE)
 
     return text
 
@@ -54,9 +76,7 @@ def remove_special_chars(text):
        comma (,) and question mark (?)
        for instance, ">", "~", ", $, |, etc.
     """
-    schars = ''.join([a for a in string.punctuation if a not in ".,?"])
-
-    text = re.sub('[%s]' % re.escape(schars), '', text)
+    text = text.translate(SPECIAL_CHARS_TABLE)
     return text
 
 
@@ -75,13 +95,25 @@ def remove_extra_white_space(text):
     return remove_extra_space(text)
 
 
+_stopwords = None
+
+
+def get_stopwords():
+    """Returns English stopwords as a frozenset (loaded once)
+    """
+    global _stopwords
+    if _stopwords is None:
+        from nltk.corpus import stopwords
+        _stopwords = frozenset(stopwords.words('english'))
+    return _stopwords
+
+
 def remove_stopwords(text, swords=None):
     """Remove stopwords
     """
     if swords is None:
-        swords = stopwords.words('english')
-    words = wordpunct_tokenize(text)
-    words = [w for w in words if w not in swords]
+        swords = get_stopwords()
+    words = [w for w in re_words.findall(text) if w not in swords]
     text = ' '.join(words)
     return text
 
@@ -89,19 +121,34 @@ def remove_stopwords(text, swords=None):
 def remove_punctuation(text):
     """Replace punctuation mark with space
     """
-    text = re.sub('[%s]' % re.escape(string.punctuation), '', text)
+    text = text.translate(PUNCTUATION_TABLE)
     return text
 
 
+_stem_funcs = {}
+
+
+def get_stem_func(snowball=False):
+    """Returns memoized stem function of the stemmer (created once)
+    """
+    stem = _stem_funcs.get(snowball)
+    if stem is None:
+        if snowball:
+            from nltk.stem.snowball import EnglishStemmer
+            st = EnglishStemmer()
+        else:
+            from nltk.stem.porter import PorterStemmer
+            st = PorterStemmer()
+        stem = lru_cache(maxsize=100000)(st.stem)
+        _stem_funcs[snowball] = stem
+    return stem
+
+
 def stemmed(text, snowball=False):
     """Returns stemmed text
     """
-    if snowball:
-        st = EnglishStemmer()
-    else:
-        st = PorterStemmer()
-    words = wordpunct_tokenize(text)
-    words = [st.stem(w) for w in words]
+    stem = get_stem_func(snowball)
+    words = [stem(w) for w in re_words.findall(text)]
     text = ' '.join(words)
 
     return text
@@ -145,6 +192,26 @@ def export(outdir, filename, text):
     return False
 
 
+re_sentence_enders = re.compile(r"""
+    # Split sentences on whitespace between them.
+    (?:               # Group for two positive lookbehinds.
+      (?<=[.!?])      # Either an end of sentence punct,
+    | (?<=[.!?]['"])  # or end of sentence punct and quote.
+    )                 # End group of two positive lookbehinds.
+    (?<!  Mr\.   )    # Don't end sentence on "Mr."
+    (?<!  Mrs\.  )    # Don't end sentence on "Mrs."
+    (?<!  Jr\.   )    # Don't end sentence on "Jr."
+    (?<!  Dr\.   )    # Don't end sentence on "Dr."
+    (?<!  Prof\. )    # Don't end sentence on "Prof."
+    (?<!  Sr\.   )    # Don't end sentence on "Sr."
+    (?<!  Sen\.  )
+    (?<!  Ms\.   )
+    (?<!  Rep\.  )
+    (?<!  Gov\.  )
+    \s+               # Split on whitespace between sentences.
+    """, re.IGNORECASE | re.VERBOSE)
+
+
 def split_sentences(text):
     """Returns split sentences list and index of splitting point
 
@@ -152,32 +219,14 @@ def split_sentences(text):
        http://stackoverflow.com/questions/8465335/a-regex-for-extracting-
               sentence-from-a-paragraph-in-python
     """
-    sentenceEnders = re.compile(r"""
-        # Split sentences on whitespace between them.
-        (?:               # Group for two positive lookbehinds.
-          (?<=[.!?])      # Either an end of sentence punct,
-        | (?<=[.!?]['"])  # or end of sentence punct and quote.
-        )                 # End group of two positive lookbehinds.
-        (?<!  Mr\.   )    # Don't end sentence on "Mr."
-        (?<!  Mrs\.  )    # Don't end sentence on "Mrs."
-        (?<!  Jr\.   )    # Don't end sentence on "Jr."
-        (?<!  Dr\.   )    # Don't end sentence on "Dr."
-        (?<!  Prof\. )    # Don't end sentence on "Prof."
-        (?<!  Sr\.   )    # Don't end sentence on "Sr."
-        (?<!  Sen\.  )
-        (?<!  Ms\.   )
-        (?<!  Rep\.  )
-        (?<!  Gov\.  )
-        \s+               # Split on whitespace between sentences.
-        """, re.IGNORECASE | re.VERBOSE)
-    sentenceList = sentenceEnders.split(text)
+    sentenceList = re_sentence_enders.split(text)
     st_index = [0]
-    for s in sentenceEnders.finditer(text):
-        st_index.append(s.start())
+    st_index.extend(m.start() for m in re_sentence_enders.finditer(text))
     return sentenceList, st_index
 
 
 def init_nltk():
+    import nltk
     nltk.data.path.append("./nltk_data")
     if not os.path.exists('./nltk_data/corpora/stopwords'):
         nltk.download('stopwords', './nltk_data')
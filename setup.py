@@ -116,10 +116,9 @@ setup(
     # https://packaging.python.org/en/latest/requirements.html
     install_requires=[
         'nameparser',
-        'python-Levenshtein',
+        'rapidfuzz>=3',
         'regex',
-        'nltk',
-        'six'
+        'nltk'
     ],
 
     # List additional groups of dependencies here (e.g. development